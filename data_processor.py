@@ -1,13 +1,102 @@
 import pandas as pd
+import copy
 import json
+import hashlib
+import os
+import re
+from contextlib import nullcontext
 from pathlib import Path
 import logging
-from typing import Dict, Tuple
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
+from typing import Dict, List, Optional, Tuple
+from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig, pipeline
 import torch
 import sys
+from threading import Lock
+
+try:
+    import orjson  # parseur C ~5x plus rapide que le json stdlib
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
+
+# Modèle/tokenizer partagés entre toutes les instances de TermClassifier
+# (évite de recharger le 7B quantifié si le classifieur est instancié plusieurs fois)
+_MODEL_CACHE: Dict[str, Tuple] = {}
+_MODEL_CACHE_LOCK = Lock()
+
+# Backend 'causal-lm' : l'ancien classifieur génératif, gardé en secours
+CAUSAL_MODEL_NAME = "deepseek-ai/deepseek-llm-7b-chat"
+
+# Backend 'zero-shot' (défaut) : un encodeur NLI ~400M suffit largement pour 3 classes
+# et évite le surcoût de déquantification NF4 du 7B
+ZEROSHOT_MODEL_NAME = "facebook/bart-large-mnli"
+ZEROSHOT_HYPOTHESIS = "This ATM term refers to a {}."
+ZEROSHOT_LABELS = {'action': 'action', 'ticket type': 'ticket_type', 'component': 'component'}
+
+# Écart de score NLI minimal entre les deux meilleures étiquettes ; en dessous, fallback mots-clés
+ZEROSHOT_TIE_MARGIN = 0.05
+
+# VRAM libre minimale pour charger le 7B en fp16 ; en dessous on retombe sur NF4
+NF4_VRAM_THRESHOLD = 16 * 1024 ** 3
+
+# Config NF4 unique, construite et validée une fois au chargement du module ;
+# elle sert aussi de clé stable pour _MODEL_CACHE.
+# Pas d'offload CPU : device_map={"":0} garde tout sur le GPU, et activer l'offload
+# sélectionnait un kernel 4-bit plus lent pour rien.
+# bnb_4bit_compute_dtype aligné sur le dtype des activations (bf16 sur Ampere+).
+NF4_QUANT_CONFIG = BitsAndBytesConfig(
+    load_in_4bit=True,
+    bnb_4bit_compute_dtype=(
+        torch.bfloat16
+        if torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+        else torch.float16
+    ),
+    bnb_4bit_use_double_quant=True,
+    bnb_4bit_quant_type="nf4"
+)
+
+# À incrémenter quand le prompt change : invalide le cache de classification
+PROMPT_VERSION = 2
+
+# Partie statique du prompt du backend causal-lm : encodée une seule fois, son KV-cache
+# est réutilisé pour chaque lot (seul le suffixe TERM/ENGLISH/FRENCH varie)
+PROMPT_PREFIX = """Classify this ATM technical term into exactly one of these categories:
+'action', 'ticket_type', or 'component':
+
+CATEGORY DEFINITIONS:
+1. 'action': Repair processes, system operations, approval processes
+2. 'ticket_type': Types of problems or maintenance categories
+3. 'component': Physical or logical parts of the ATM
+
+EXAMPLES:
+- "Repair" -> action
+- "HW ISSUE" -> ticket_type
+- "CDM" -> component
+- "Reset" -> action
+- "PREVENTIVE MAINTENANCE" -> ticket_type
+- "Feeder" -> component
+
+ANALYSIS: Consider the term's function and context in both languages.
+
+"""
+
+# Taille de lot pour la classification par le LLM (amortit le coût d'un generate par terme)
+BATCH_SIZE = 16
+
+# Fréquence d'écriture du cache sur disque pendant process_new_terms
+CACHE_FLUSH_EVERY = 32
+
+# Marge de logits minimale entre les deux meilleures catégories ; en dessous, fallback mots-clés
+LOGIT_MARGIN_THRESHOLD = 1.0
+
+# Mots-clés utilisés par l'heuristique (pré-filtre) et par le fallback après LLM,
+# compilés en une alternation unique : un seul scan C par texte au lieu d'un
+# `in` Python par mot-clé
+ACTION_KEYWORDS = frozenset({'repair', 'replace', 'reset', 'upgrade', 'install', 'approval', 'completed', 'reported', 'client issue'})
+TICKET_TYPE_KEYWORDS = frozenset({'issue', 'fault', 'error', 'vandalism', 'misuse', 'non conform', 'maintenance', 'conformity', 'service'})
+_ACTION_RE = re.compile('|'.join(map(re.escape, sorted(ACTION_KEYWORDS))))
+_TICKET_TYPE_RE = re.compile('|'.join(map(re.escape, sorted(TICKET_TYPE_KEYWORDS))))
 def configure_logging():
     # Fonction à appeler pour configurer le logging (console + fichier)
     logging.basicConfig(
@@ -19,13 +108,48 @@ def configure_logging():
         ]
     )
 class TermClassifier:
-    def __init__(self, excel_path: str):
+    def __init__(self, excel_path: str, backend: str = 'zero-shot', precision: str = 'fp16'):
         self.excel_path = Path(excel_path)
         self.actions_path = Path('actions.json')
         self.ticket_types_path = Path('ticket_types.json')
         self.components_path = Path('components.json')
+        self.backend = backend
+        self.precision = precision
+        self.model_name = ZEROSHOT_MODEL_NAME if backend == 'zero-shot' else CAUSAL_MODEL_NAME
         self.model = None
         self.tokenizer = None
+        self.zs_pipeline = None
+        self.cache_path = Path('classification_cache.json')
+        self._cache = self._load_cache()
+
+    def _load_cache(self) -> Dict[str, str]:
+        # Cache persistant des décisions du LLM, invalidé si le modèle ou le prompt change
+        if self.cache_path.exists():
+            try:
+                with open(self.cache_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('model_name') == self.model_name and data.get('prompt_version') == PROMPT_VERSION:
+                    return data.get('entries', {})
+                logger.info("Cache de classification obsolète (modèle ou prompt modifié), ignoré")
+            except Exception as e:
+                logger.warning(f"Cache de classification illisible: {e}")
+        return {}
+
+    @staticmethod
+    def _cache_key(term: str, en: str, fr: str) -> str:
+        return hashlib.sha1(f"{term}|{en}|{fr}".lower().encode('utf-8')).hexdigest()
+
+    def _flush_cache(self):
+        # Écriture atomique : tempfile puis os.replace pour éviter un fichier tronqué
+        tmp_path = self.cache_path.with_suffix('.json.tmp')
+        payload = {
+            'model_name': self.model_name,
+            'prompt_version': PROMPT_VERSION,
+            'entries': self._cache
+        }
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.cache_path)
 
     def load_existing_classifications(self) -> Dict[str, str]:
         classifications = {}
@@ -36,114 +160,289 @@ class TermClassifier:
         ]
         for path, category in category_files:
             if path.exists():
-                with open(path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for term in data:
-                        classifications[term.upper()] = category
+                with open(path, 'rb') as f:
+                    raw = f.read()
+                data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+                # Seules les clés comptent ici ; les valeurs sont relues par load_json au merge
+                classifications.update({term.upper(): category for term in data})
         return classifications
 
     def get_new_terms(self, df: pd.DataFrame, existing: Dict[str, str]) -> pd.DataFrame:
-        excel_terms = set(df['abbr'].str.strip().str.upper())
-        existing_terms = set(existing.keys())
-        new_terms = excel_terms - existing_terms
-        return df[df['abbr'].str.strip().str.upper().isin(new_terms)].copy()
+        # Une seule passe de normalisation, réutilisée pour le masque et par process_new_terms
+        stripped = df['abbr'].astype(str).str.strip()
+        new_mask = ~stripped.str.upper().isin(frozenset(existing))
+        return df.loc[new_mask].assign(_abbr_norm=stripped[new_mask])
 
     def load_model(self):
-        if self.model is None:
-            quant_config = BitsAndBytesConfig(
-                load_in_4bit=True,
-                bnb_4bit_compute_dtype=torch.float16,
-                bnb_4bit_use_double_quant=True,
-                bnb_4bit_quant_type="nf4",
-                llm_int8_enable_fp32_cpu_offload=True
-            )
-            self.tokenizer = AutoTokenizer.from_pretrained("deepseek-ai/deepseek-llm-7b-chat")
-            self.tokenizer.pad_token = self.tokenizer.eos_token
-            self.model = AutoModelForCausalLM.from_pretrained(
-                "deepseek-ai/deepseek-llm-7b-chat",
-                quantization_config=quant_config,
-                device_map={"": 0}  # éviter "auto" qui tente de tout charger sur le GPU
-            )
-            logger.info("Modèle chargé avec config adaptée")
+        if self.backend == 'zero-shot':
+            if self.zs_pipeline is not None:
+                return
+            cache_key = f"zero-shot|{ZEROSHOT_MODEL_NAME}"
+            with _MODEL_CACHE_LOCK:
+                if cache_key not in _MODEL_CACHE:
+                    _MODEL_CACHE[cache_key] = pipeline(
+                        "zero-shot-classification",
+                        model=ZEROSHOT_MODEL_NAME,
+                        device=0 if torch.cuda.is_available() else -1,
+                        torch_dtype=torch.float16 if torch.cuda.is_available() else None
+                    )
+                    logger.info("Classifieur zero-shot chargé")
+                self.zs_pipeline = _MODEL_CACHE[cache_key]
+            return
 
-    def generate_prompt(self, term: str, en: str, fr: str) -> str:
-        return f"""Classify this ATM technical term into exactly one of these categories: 
-'action', 'ticket_type', or 'component':
+        if self.model is not None:
+            return
+        precision = self.precision
+        if precision == 'fp16' and torch.cuda.is_available():
+            if torch.cuda.mem_get_info()[0] < NF4_VRAM_THRESHOLD:
+                logger.info("VRAM libre insuffisante pour fp16, bascule en NF4")
+                precision = 'nf4'
+        if precision == 'nf4':
+            # NF4 n'a pas de matmul matériel : à réserver aux GPU qui ne tiennent pas le fp16
+            model_kwargs = {'quantization_config': NF4_QUANT_CONFIG}
+            cache_key = f"{CAUSAL_MODEL_NAME}|{sorted(NF4_QUANT_CONFIG.to_dict().items())}"
+        else:
+            model_kwargs = {'torch_dtype': torch.float16, 'attn_implementation': 'sdpa'}
+            try:
+                import flash_attn  # noqa: F401
+                model_kwargs['attn_implementation'] = 'flash_attention_2'
+            except ImportError:
+                pass
+            cache_key = f"{CAUSAL_MODEL_NAME}|fp16"
+        with _MODEL_CACHE_LOCK:
+            if cache_key not in _MODEL_CACHE:
+                tokenizer = AutoTokenizer.from_pretrained(CAUSAL_MODEL_NAME)
+                tokenizer.pad_token = tokenizer.eos_token
+                model = AutoModelForCausalLM.from_pretrained(
+                    CAUSAL_MODEL_NAME,
+                    device_map={"": 0},  # éviter "auto" qui tente de tout charger sur le GPU
+                    **model_kwargs
+                )
+                model.eval()  # inference uniquement : désactive dropout et co.
+                # Avec des lots triés par longueur, les shapes se répètent : torch.compile
+                # spécialise le forward et supprime le surcoût de dispatch Python
+                try:
+                    model = torch.compile(model, mode='reduce-overhead', fullgraph=False)
+                    logger.info("Forward compilé avec torch.compile")
+                except Exception as e:
+                    logger.warning(f"torch.compile indisponible, mode eager conservé: {e}")
+                # Ids des premiers tokens de chaque catégorie pour la classification contrainte
+                cat_token_ids = {
+                    cat: tokenizer.encode(" " + cat, add_special_tokens=False)[0]
+                    for cat in ('action', 'ticket', 'component')
+                }
+                # KV-cache du préfixe statique du prompt : encodé une seule fois ici,
+                # rejoué pour chaque lot (seul le suffixe par terme reste à encoder)
+                prefix_ids = tokenizer(PROMPT_PREFIX, return_tensors="pt").input_ids.to(model.device)
+                with torch.inference_mode():
+                    prefix_past = model(input_ids=prefix_ids, use_cache=True).past_key_values
+                _MODEL_CACHE[cache_key] = (model, tokenizer, cat_token_ids, prefix_ids.shape[1], prefix_past)
+                logger.info("Modèle chargé avec config adaptée")
+            (self.model, self.tokenizer, self.cat_token_ids,
+             self._prefix_len, self._prefix_past) = _MODEL_CACHE[cache_key]
 
-TERM: "{term}"
+    def generate_prompt_suffix(self, term: str, en: str, fr: str) -> str:
+        return f"""TERM: "{term}"
 ENGLISH: "{en}"
 FRENCH: "{fr}"
 
-CATEGORY DEFINITIONS:
-1. 'action': Repair processes, system operations, approval processes
-2. 'ticket_type': Types of problems or maintenance categories
-3. 'component': Physical or logical parts of the ATM
-
-EXAMPLES:
-- "Repair" -> action
-- "HW ISSUE" -> ticket_type
-- "CDM" -> component
-- "Reset" -> action
-- "PREVENTIVE MAINTENANCE" -> ticket_type
-- "Feeder" -> component
-
-ANALYSIS: Consider the term's function and context in both languages.
-
 RESPOND ONLY WITH THE CATEGORY NAME: 'action', 'ticket_type', or 'component'"""
 
+    def generate_prompt(self, term: str, en: str, fr: str) -> str:
+        return PROMPT_PREFIX + self.generate_prompt_suffix(term, en, fr)
+
     def classify_term(self, term: str, en: str, fr: str) -> str:
+        return self.classify_terms_batch([(term, en, fr)])[0]
+
+    def classify_terms_batch(self, rows: List[Tuple[str, str, str]]) -> List[str]:
         self.load_model()
-        prompt = self.generate_prompt(term, en, fr)
-        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
-        outputs = self.model.generate(
-            **inputs,
-            max_new_tokens=15,
-            pad_token_id=self.tokenizer.eos_token_id,
-            do_sample=False
+        if self.backend == 'zero-shot':
+            return self._classify_zero_shot(rows)
+        return self._classify_causal(rows)
+
+    def _classify_zero_shot(self, rows: List[Tuple[str, str, str]]) -> List[str]:
+        sequences = [f"{term} ({en} / {fr})" for term, en, fr in rows]
+        outputs = self.zs_pipeline(
+            sequences,
+            candidate_labels=list(ZEROSHOT_LABELS),
+            hypothesis_template=ZEROSHOT_HYPOTHESIS,
+            batch_size=min(len(sequences), 64)
         )
-        response = self.tokenizer.decode(
-            outputs[0][len(inputs.input_ids[0]):], 
-            skip_special_tokens=True
-        ).strip().lower()
+        if isinstance(outputs, dict):  # la pipeline renvoie un dict pour une seule séquence
+            outputs = [outputs]
+        results = []
+        for (term, en, fr), output in zip(rows, outputs):
+            scores = output['scores']
+            if len(scores) > 1 and scores[0] - scores[1] < ZEROSHOT_TIE_MARGIN:
+                # Scores NLI trop proches : on laisse les mots-clés trancher
+                results.append(self._keyword_fallback(term, en, fr))
+            else:
+                results.append(ZEROSHOT_LABELS[output['labels'][0]])
+        return results
+
+    def _classify_causal(self, rows: List[Tuple[str, str, str]]) -> List[str]:
+        # Décodage contraint : un seul forward, on lit les logits des trois catégories
+        # au lieu de générer 15 tokens puis de chercher le nom de catégorie dans le texte.
+        # Seul le suffixe par terme est encodé, le préfixe vient du KV-cache précalculé.
+        suffixes = [self.generate_prompt_suffix(term, en, fr) for term, en, fr in rows]
+        # inference_mode sur tout le chemin (tokenisation comprise) : aucun
+        # suivi autograd ni bump de version-counter sur ces tenseurs
+        with torch.inference_mode():
+            self.tokenizer.padding_side = 'left'
+            inputs = self.tokenizer(
+                suffixes, return_tensors="pt", padding=True, truncation=True,
+                add_special_tokens=False  # le BOS est déjà dans le préfixe
+            ).to(self.model.device)
+            batch_size = inputs.input_ids.shape[0]
+            # Le préfixe est partagé : son KV-cache est dupliqué sur la dimension batch.
+            # transformers récents renvoient un objet Cache (DynamicCache) que le
+            # forward mutera en y ajoutant le suffixe : copie obligatoire à chaque
+            # lot pour ne pas corrompre le préfixe mis en cache dans _MODEL_CACHE.
+            if isinstance(self._prefix_past, tuple):
+                # Ancien format en tuples (k, v) par couche : expand suffit (vues)
+                past = tuple(
+                    (k.expand(batch_size, -1, -1, -1), v.expand(batch_size, -1, -1, -1))
+                    for k, v in self._prefix_past
+                )
+            else:
+                past = copy.deepcopy(self._prefix_past)
+                past.batch_repeat_interleave(batch_size)
+            attention_mask = torch.cat([
+                torch.ones(
+                    (batch_size, self._prefix_len),
+                    dtype=inputs.attention_mask.dtype,
+                    device=inputs.attention_mask.device
+                ),
+                inputs.attention_mask
+            ], dim=1)
+            # Positions recalculées depuis le masque (padding à gauche dans le suffixe)
+            position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, self._prefix_len:]
+            if torch.cuda.is_available() and torch.cuda.is_bf16_supported():
+                autocast_ctx = torch.autocast(device_type='cuda', dtype=torch.bfloat16)
+            else:
+                autocast_ctx = nullcontext()
+            with autocast_ctx:
+                logits = self.model(
+                    input_ids=inputs.input_ids,
+                    attention_mask=attention_mask,
+                    position_ids=position_ids,
+                    past_key_values=past
+                ).logits[:, -1, :]
+
+        categories = ('action', 'ticket', 'component')
+        cat_ids = [self.cat_token_ids[cat] for cat in categories]
+        cat_logits = logits[:, cat_ids].float().cpu()
+        ranked = cat_logits.sort(dim=-1, descending=True)
+        margins = ranked.values[:, 0] - ranked.values[:, 1]
+        best = cat_logits.argmax(dim=-1)
+
+        results = []
+        for i, (term, en, fr) in enumerate(rows):
+            if margins[i].item() < LOGIT_MARGIN_THRESHOLD:
+                # Modèle indécis : on retombe sur les mots-clés
+                results.append(self._keyword_fallback(term, en, fr))
+            else:
+                category = categories[best[i].item()]
+                results.append('ticket_type' if category == 'ticket' else category)
+        return results
+
+    def _sort_by_prompt_length(self, rows: List[Tuple[str, str, str]]) -> List[Tuple[str, str, str]]:
+        # Les résultats sont rangés par terme, pas par position : pas besoin de dé-permuter
+        if self.backend == 'zero-shot':
+            # La pipeline fait son propre padding ; la longueur de chaîne est un bon proxy
+            lengths = [len(f"{term} {en} {fr}") for term, en, fr in rows]
+        else:
+            self.load_model()
+            suffixes = [self.generate_prompt_suffix(term, en, fr) for term, en, fr in rows]
+            lengths = [
+                len(ids) for ids in
+                self.tokenizer(suffixes, add_special_tokens=False).input_ids
+            ]
+        order = sorted(range(len(rows)), key=lengths.__getitem__)
+        return [rows[i] for i in order]
 
-        if 'action' in response:
+    def _keyword_fallback(self, term: str, en: str, fr: str) -> str:
+        text = f"{term} {en} {fr}".lower()
+        if _ACTION_RE.search(text):
             return 'action'
-        elif 'ticket_type' in response or 'ticket' in response:
+        elif _TICKET_TYPE_RE.search(text):
             return 'ticket_type'
-        elif 'component' in response:
-            return 'component'
+        return 'component'
 
-        # fallback heuristique
+    def _heuristic_classify(self, term: str, en: str, fr: str) -> Optional[str]:
+        # Pré-filtre sans LLM : ne tranche que si une seule catégorie de mots-clés matche
         text = f"{term} {en} {fr}".lower()
-        if any(kw in text for kw in {'repair', 'replace', 'reset', 'upgrade', 'install', 'approval', 'completed', 'reported', 'client issue'}):
+        is_action = _ACTION_RE.search(text) is not None
+        is_ticket_type = _TICKET_TYPE_RE.search(text) is not None
+        if is_action and not is_ticket_type:
             return 'action'
-        elif any(kw in text for kw in {'issue', 'fault', 'error', 'vandalism', 'misuse', 'non conform', 'maintenance', 'conformity', 'service'}):
+        if is_ticket_type and not is_action:
             return 'ticket_type'
-        return 'component'
+        return None
 
     def process_new_terms(self, new_terms: pd.DataFrame) -> Tuple[Dict, Dict, Dict]:
         actions, ticket_types, components = {}, {}, {}
-        for _, row in new_terms.iterrows():
-            term = str(row['abbr']).strip()
-            en = str(row['en']).strip()
-            fr = str(row['fr']).strip()
-            if not term or pd.isna(en) or pd.isna(fr):
+
+        def assign(term, en, fr, classification, source):
+            result = {'en': en, 'fr': fr}
+            if classification == 'action':
+                actions[term] = result
+            elif classification == 'ticket_type':
+                ticket_types[term] = result
+            else:
+                components[term] = result
+            logger.info(f"{source}: {term} -> {classification}")
+
+        # Filtrage et extraction vectorisés : pas de Series par ligne comme avec iterrows
+        valid = pd.notna(new_terms['en']) & pd.notna(new_terms['fr'])
+        subset = new_terms.loc[valid]
+        # Les colonnes sont déjà normalisées au chargement (run) ou par get_new_terms
+        if '_abbr_norm' in subset.columns:
+            terms = subset['_abbr_norm'].to_numpy()
+        else:
+            terms = subset['abbr'].astype(str).to_numpy()
+        ens = subset['en'].astype(str).to_numpy()
+        frs = subset['fr'].astype(str).to_numpy()
+
+        rows = []
+        for term, en, fr in zip(terms, ens, frs):
+            if not term:
+                continue
+            cached = self._cache.get(self._cache_key(term, en, fr))
+            if cached is not None:
+                assign(term, en, fr, cached, "CACHE")
+                continue
+            classification = self._heuristic_classify(term, en, fr)
+            if classification is not None:
+                assign(term, en, fr, classification, "HEURISTIC")
                 continue
+            rows.append((term, en, fr))
+
+        if rows:
+            # Tri par longueur avant découpage en lots : chaque lot est homogène,
+            # donc presque aucun token de padding à traiter
+            rows = self._sort_by_prompt_length(rows)
+
+        pending_flush = 0
+        for start in range(0, len(rows), BATCH_SIZE):
+            batch = rows[start:start + BATCH_SIZE]
             try:
-                classification = self.classify_term(term, en, fr)
-                result = {'en': en, 'fr': fr}
-                if classification == 'action':
-                    actions[term] = result
-                    logger.info(f"CLASSIFIED: {term} -> action")
-                elif classification == 'ticket_type':
-                    ticket_types[term] = result
-                    logger.info(f"CLASSIFIED: {term} -> ticket_type")
-                else:
-                    components[term] = result
-                    logger.info(f"CLASSIFIED: {term} -> component")
+                classifications = self.classify_terms_batch(batch)
             except Exception as e:
-                logger.error(f"Error classifying {term}: {e}")
-                components[term] = {'en': en, 'fr': fr}
+                logger.error(f"Error classifying batch starting at {start}: {e}")
+                for term, en, fr in batch:
+                    components[term] = {'en': en, 'fr': fr}
+                continue
+            for (term, en, fr), classification in zip(batch, classifications):
+                assign(term, en, fr, classification, "LLM")
+                self._cache[self._cache_key(term, en, fr)] = classification
+                pending_flush += 1
+            # Flush périodique pour ne pas perdre le travail en cas de crash
+            if pending_flush >= CACHE_FLUSH_EVERY:
+                self._flush_cache()
+                pending_flush = 0
+        if pending_flush:
+            self._flush_cache()
         return actions, ticket_types, components
 
     def merge_results(self, new_actions: Dict, new_ticket_types: Dict, new_components: Dict) -> Tuple[Dict, Dict, Dict]:
@@ -151,33 +450,74 @@ RESPOND ONLY WITH THE CATEGORY NAME: 'action', 'ticket_type', or 'component'"""
         final_ticket_types = self.load_json(self.ticket_types_path)
         final_components = self.load_json(self.components_path)
 
-        final_actions.update(new_actions)
-        final_ticket_types.update(new_ticket_types)
-        final_components.update(new_components)
+        # On note quelles catégories ont réellement changé pour ne réécrire que celles-là
+        self._dirty = {
+            'actions': self._apply_updates(final_actions, new_actions),
+            'ticket_types': self._apply_updates(final_ticket_types, new_ticket_types),
+            'components': self._apply_updates(final_components, new_components)
+        }
         return final_actions, final_ticket_types, final_components
 
+    @staticmethod
+    def _apply_updates(target: Dict, updates: Dict) -> bool:
+        changed = False
+        for key, value in updates.items():
+            if target.get(key) != value:
+                target[key] = value
+                changed = True
+        return changed
+
     def load_json(self, path: Path) -> Dict:
         if path.exists():
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(path, 'rb') as f:
+                raw = f.read()
+            return orjson.loads(raw) if orjson is not None else json.loads(raw)
         return {}
 
+    @staticmethod
+    def _write_json_atomic(path: Path, data: Dict):
+        # Écriture sur tempfile puis os.replace : pas de fichier tronqué en cas de crash
+        tmp_path = path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
     def save_results(self, actions: Dict, ticket_types: Dict, components: Dict):
-        with open(self.actions_path, 'w', encoding='utf-8') as f:
-            json.dump(actions, f, ensure_ascii=False, indent=2)
-        with open(self.ticket_types_path, 'w', encoding='utf-8') as f:
-            json.dump(ticket_types, f, ensure_ascii=False, indent=2)
-        with open(self.components_path, 'w', encoding='utf-8') as f:
-            json.dump(components, f, ensure_ascii=False, indent=2)
+        dirty = getattr(self, '_dirty', None)
+        for name, path, data in (
+            ('actions', self.actions_path, actions),
+            ('ticket_types', self.ticket_types_path, ticket_types),
+            ('components', self.components_path, components)
+        ):
+            if dirty is not None and not dirty.get(name, True):
+                logger.info(f"{name}: aucun changement, fichier non réécrit")
+                continue
+            self._write_json_atomic(path, data)
 
     def run(self):
         try:
-            df = pd.read_excel(self.excel_path, sheet_name='Feuil1')
+            # Le moteur calamine (Rust) est nettement plus rapide qu'openpyxl s'il est installé
+            try:
+                import python_calamine  # noqa: F401
+                engine = 'calamine'
+            except ImportError:
+                engine = 'openpyxl'
+            # usecols + dtype='string' : on ne matérialise que les trois colonnes utiles
+            df = pd.read_excel(
+                self.excel_path,
+                sheet_name='Feuil1',
+                usecols=['Abréviation', 'Nom complet anglais', 'Nom en français'],
+                dtype='string',
+                engine=engine
+            )
             df = df.rename(columns={
                 'Abréviation': 'abbr',
-                'Nom complet anglais': 'en', 
+                'Nom complet anglais': 'en',
                 'Nom en français': 'fr'
             }).dropna(subset=['abbr'])
+            # Normalisation unique des trois colonnes : plus aucun strip en aval
+            for col in ('abbr', 'en', 'fr'):
+                df[col] = df[col].astype('string').str.strip()
             existing = self.load_existing_classifications()
             new_terms_df = self.get_new_terms(df, existing)
 
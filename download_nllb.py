@@ -1,11 +1,24 @@
+import os
+
+import torch
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 
 model_name = "facebook/nllb-200-distilled-600M"
 
-print("Downloading model and tokenizer...")
-
-# This will download and cache the model locally in ~/.cache/huggingface/
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+# Pinned revision for deterministic downloads; override with NLLB_REVISION if needed
+revision = os.environ.get("NLLB_REVISION", "main")
 
-print("Model downloaded and ready!")
+try:
+    # Fast path: model already in ~/.cache/huggingface/, no hub metadata round-trip
+    tokenizer = AutoTokenizer.from_pretrained(model_name, local_files_only=True)
+    model = AutoModelForSeq2SeqLM.from_pretrained(
+        model_name, local_files_only=True, torch_dtype=torch.float16
+    )
+    print("Model already cached, nothing to download.")
+except OSError:
+    print("Downloading model and tokenizer...")
+    tokenizer = AutoTokenizer.from_pretrained(model_name, revision=revision)
+    model = AutoModelForSeq2SeqLM.from_pretrained(
+        model_name, revision=revision, torch_dtype=torch.float16
+    )
+    print("Model downloaded and ready!")
@@ -1,7 +1,22 @@
+import hashlib
+
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime
 
+
+# Session HTTP partagée entre les reruns Streamlit : keep-alive vers les deux
+# serveurs locaux au lieu d'une nouvelle connexion TCP par clic
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
+
+
+SESSION = get_session()
+
 # Streamlit Page Config
 st.set_page_config(
     page_title="ATM_LLM Report",
@@ -96,6 +111,26 @@ def generate_fallback_if_missing(english_message, technical_input):
             return english_message.strip() + "\n" + fallback_sentence
     return english_message
 
+# Cached call to /translate: repeat clicks on the same English message are served
+# from the session cache instead of re-running NLLB
+def translate_message(english_message):
+    cache = st.session_state.setdefault("_translation_cache", {})
+    key = hashlib.sha1(english_message.encode('utf-8')).hexdigest()
+    if key in cache:
+        return cache[key], None
+    trans_res = SESSION.post(
+        "http://localhost:5002/translate",
+        json={"text": english_message},
+        timeout=120
+    )
+    if trans_res.status_code != 200:
+        return None, f"Translation error: {trans_res.text}"
+    translation = trans_res.json().get("translated_text", "")
+    if not translation:
+        return None, "No translation received."
+    cache[key] = translation
+    return translation, None
+
 # Buttons layout
 col1, col2, col3 = st.columns([1, 1, 1])
 
@@ -108,7 +143,7 @@ with col1:
         else:
             with st.spinner("Generating both reports..."):
                 try:
-                    res = requests.post(
+                    res = SESSION.post(
                         "http://localhost:5000/generate-message",
                         json={"technical_input": technical_input},
                         timeout=120
@@ -125,19 +160,11 @@ with col1:
                         st.error(f"English generation error: {res.text}")
 
                     if st.session_state.english_message:
-                        trans_res = requests.post(
-                            "http://localhost:5002/translate",
-                            json={"text": st.session_state.english_message},
-                            timeout=120
-                        )
-                        if trans_res.status_code == 200:
-                            translation = trans_res.json().get("translated_text", "")
-                            if translation:
-                                st.session_state.translated_message = f"Translated on {current_time.strftime('%Y-%m-%d %I:%M %p CET')}:\n\n{translation}"
-                            else:
-                                st.error("No translation received.")
+                        translation, error = translate_message(st.session_state.english_message)
+                        if translation:
+                            st.session_state.translated_message = f"Translated on {current_time.strftime('%Y-%m-%d %I:%M %p CET')}:\n\n{translation}"
                         else:
-                            st.error(f"Translation error: {trans_res.text}")
+                            st.error(error)
                     st.success("Both reports generated!")
                 except Exception as e:
                     st.error(f"Unexpected error: {e}")
@@ -151,7 +178,7 @@ with col2:
         else:
             with st.spinner("Generating English report..."):
                 try:
-                    res = requests.post(
+                    res = SESSION.post(
                         "http://localhost:5000/generate-message",
                         json={"technical_input": technical_input},
                         timeout=30
@@ -179,20 +206,12 @@ with col3:
         else:
             with st.spinner("Generating French report..."):
                 try:
-                    trans_res = requests.post(
-                        "http://localhost:5002/translate",
-                        json={"text": st.session_state.english_message},
-                        timeout=120
-                    )
-                    if trans_res.status_code == 200:
-                        translation = trans_res.json().get("translated_text", "")
-                        if translation:
-                            st.session_state.translated_message = f"Translated on {current_time.strftime('%Y-%m-%d %I:%M %p CET')}:\n\n{translation}"
-                            st.success("French report generated!")
-                        else:
-                            st.error("No translation received.")
+                    translation, error = translate_message(st.session_state.english_message)
+                    if translation:
+                        st.session_state.translated_message = f"Translated on {current_time.strftime('%Y-%m-%d %I:%M %p CET')}:\n\n{translation}"
+                        st.success("French report generated!")
                     else:
-                        st.error(f"Translation error: {trans_res.text}")
+                        st.error(error)
                 except Exception as e:
                     st.error(f"Unexpected error: {e}")
 
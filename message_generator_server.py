@@ -1,12 +1,13 @@
 from flask import Flask, request, jsonify
 from llama_cpp import Llama
-import json
-from threading import Lock
+from threading import Lock, RLock
+import collections
 import logging
 import sys
 import re
 from logging import StreamHandler, FileHandler, Formatter
 from data_processor import TermClassifier
+from term_store import load_terms
 import random
 import os
 
@@ -28,8 +29,36 @@ logger.addHandler(file_handler)
 
 # --- Model Configuration ---
 local_model_path = "C:/Users/mouss/Desktop/MistralAI_LLM_TSS_2/mistral-7b-instruct-v0.1.Q4_K_M.gguf"
-n_ctx = 2048
-n_gpu_layers = 0
+n_ctx = 1024  # prompts are ~300 tokens; a smaller KV cache means faster prefill and less RAM
+n_gpu_layers = int(os.getenv('LLAMA_N_GPU_LAYERS', -1))  # -1 = offload every layer to the GPU
+n_threads = int(os.getenv('LLAMA_N_THREADS', os.cpu_count() or 4))
+n_batch = int(os.getenv('LLAMA_N_BATCH', 512))
+
+# Fixed prompt preambles, byte-identical across calls so the llama.cpp prompt cache
+# can reuse the prefix KV; the variable content goes at the very end of each prompt
+_ENHANCE_PREFIX = (
+    "Rephrase the following technical problem description for an ATM system, while maintaining:\n"
+    "- The exact component names\n"
+    "- The original hierarchical relationships between components\n"
+    "- Technical accuracy\n\n"
+    "Improvements to make:\n"
+    "1. Replace 'which is within' with more technical relationship terms\n"
+    "2. Add a brief functional context for the affected component\n"
+    "3. Keep the description concise (1-2 sentences)\n"
+    "4. Maintain the original meaning exactly\n\n"
+)
+
+_INTERVENTION_PREFIX = (
+    "Generate a concise, professional technical intervention report for an ATM repair.\n"
+    "Rules:\n"
+    "1. Use formal language\n"
+    "2. Be concise (one sentence)\n"
+    "3. Focus ONLY on the solution\n"
+    "4. NEVER mention specific components - use ONLY 'the affected component'\n"
+    "5. Avoid mentioning the issue or problem\n"
+    "6. Do NOT use technical component names\n"
+    "7. Example format: 'The affected component was <action taken>.'\n"
+)
 
 class ModelManager:
     _instance = None
@@ -43,12 +72,30 @@ class ModelManager:
         return cls._instance
 
     def _init_model(self):
+        # Llama is not thread-safe and enhance_many mutates global model state
+        # (reset/eval/save_state/load_state): every model call must hold this.
+        # RLock because enhance_many's fallback re-enters via
+        # enhance_problem_description on the same thread.
+        self.inference_lock = RLock()
         try:
             self.model = Llama(
                 model_path=local_model_path,
                 n_ctx=n_ctx,
-                n_gpu_layers=n_gpu_layers
+                n_gpu_layers=n_gpu_layers,
+                n_threads=n_threads,
+                n_batch=n_batch,
+                use_mmap=True,   # demand-page the weights once instead of copying them
+                use_mlock=False,
+                logits_all=False
             )
+            # Prompt/KV cache: the shared prefix of our prompts is encoded once and
+            # reused across calls instead of being re-prefilled every time
+            try:
+                from llama_cpp import LlamaRAMCache
+                self.model.set_cache(LlamaRAMCache(capacity_bytes=512 << 20))
+                logger.info(" Prompt KV cache enabled")
+            except Exception as e:
+                logger.warning(f" Prompt KV cache unavailable: {e}")
             logger.info(" Model loaded successfully")
         except Exception as e:
             logger.error(f" Error loading model: {e}")
@@ -65,22 +112,31 @@ class TechnicalMessageGenerator:
         )
 
     def _load_translations(self):
+        # Parsed once per process by term_store and shared with the translation server
         try:
-            with open("ticket_types.json", "r", encoding='utf-8') as f:
-                self.ticket_types = json.load(f)
-            with open("components.json", "r", encoding='utf-8') as f:
-                raw_components = json.load(f)
-                self.tech_abbreviations = {
-                    k: v for k, v in raw_components.items()
-                    if v.get('en') and v['en'].lower() != "nan"
-                }
-            with open("actions.json", "r", encoding='utf-8') as f:
-                self.action_keywords = json.load(f)
+            store = load_terms()
+            self.ticket_types = store['ticket_types']
+            self.tech_abbreviations = {
+                k: v for k, v in store['components'].items()
+                if v.get('en') and v['en'].lower() != "nan"
+            }
+            self.action_keywords = store['actions']
         except Exception as e:
             logger.error(f" Error loading translation files: {e}")
             self.ticket_types = {}
             self.tech_abbreviations = {}
             self.action_keywords = {}
+        # Token lengths that actually occur among ticket-type keys, longest first:
+        # the prefix search only has to try those instead of every prefix length
+        self._ticket_token_lens = sorted(
+            {key.count('_') + 1 for key in self.ticket_types}, reverse=True
+        )
+        # Normalized-key index for translate_component: one dict.get instead of a
+        # linear scan over every abbreviation per call
+        self._comp_by_norm = {
+            key.lower().replace("_", " ").strip(): value.get('en', key)
+            for key, value in self.tech_abbreviations.items()
+        }
 
     def translate_component(self, component: str) -> str:
         original = component.strip()
@@ -89,12 +145,14 @@ class TechnicalMessageGenerator:
         if original in self.tech_abbreviations:
             return self.tech_abbreviations[original].get('en', original)
 
-        for key, value in self.tech_abbreviations.items():
-            key_normalized = key.lower().replace("_", " ").strip()
-            if key_normalized == normalized:
-                return value.get('en', original)
+        exact = self._comp_by_norm.get(normalized)
+        if exact is not None:
+            return exact
+
+        # Rare path: substring match against the prenormalized keys
+        for key_normalized, en_term in self._comp_by_norm.items():
             if normalized in key_normalized:
-                return value.get('en', original)
+                return en_term
 
         return original.replace("_", " ")
 
@@ -103,29 +161,76 @@ class TechnicalMessageGenerator:
             return self.action_keywords[action].get('en', action)
         return action.replace("_", " ").title()
 
-    def enhance_problem_description(self, description: str) -> str:
-        prompt = (
-            f"Rephrase the following technical problem description for an ATM system, while maintaining:\n"
-            f"- The exact component names\n"
-            f"- The original hierarchical relationships between components\n"
-            f"- Technical accuracy\n\n"
-            f"Improvements to make:\n"
-            f"1. Replace 'which is within' with more technical relationship terms\n"
-            f"2. Add a brief functional context for the affected component\n"
-            f"3. Keep the description concise (1-2 sentences)\n"
-            f"4. Maintain the original meaning exactly\n\n"
-            f"Original description: \"{description}\"\n\n"
-            f"Enhanced technical description:"
+    @staticmethod
+    def _build_enhance_prompt(description: str) -> str:
+        return (
+            _ENHANCE_PREFIX
+            + f"Original description: \"{description}\"\n\n"
+            + "Enhanced technical description:"
         )
-        
+
+    def enhance_many(self, descriptions):
+        # Evaluate the shared prompt prefix once, snapshot the llama state, then
+        # decode each description's suffix from that snapshot instead of
+        # re-prefilling the instructions for every problem
+        if len(descriptions) <= 1:
+            return [self.enhance_problem_description(d) for d in descriptions]
+        # The whole stateful sequence must run under the inference lock: another
+        # request slipping in between load_state and the token loop would
+        # corrupt both generations
+        with self.model_manager.inference_lock:
+            try:
+                prefix_tokens = self.model.tokenize(_ENHANCE_PREFIX.encode('utf-8'), add_bos=True)
+                self.model.reset()
+                self.model.eval(prefix_tokens)
+                prefix_state = self.model.save_state()
+            except Exception as e:
+                logger.warning(f" Shared-prefix enhancement unavailable, falling back: {e}")
+                return [self.enhance_problem_description(d) for d in descriptions]
+
+            results = []
+            eos = self.model.token_eos()
+            for description in descriptions:
+                try:
+                    self.model.load_state(prefix_state)
+                    suffix = (
+                        f"Original description: \"{description}\"\n\n"
+                        + "Enhanced technical description:"
+                    )
+                    self.model.eval(self.model.tokenize(suffix.encode('utf-8'), add_bos=False))
+                    text = b""
+                    for _ in range(80):
+                        token = self.model.sample(temp=0.0, top_k=1)
+                        if token == eos:
+                            break
+                        piece = self.model.detokenize([token])
+                        if b"\n" in piece:
+                            break
+                        text += piece
+                        self.model.eval([token])
+                    enhanced = text.decode('utf-8', errors='ignore')
+                    enhanced = re.sub(r'[\[\]"\']', '', enhanced).strip()
+                    results.append(enhanced if enhanced else description)
+                except Exception as e:
+                    logger.warning(f" Failed batched enhancement: {e}")
+                    results.append(description)
+            self.model.reset()
+            return results
+
+    def enhance_problem_description(self, description: str) -> str:
+        prompt = self._build_enhance_prompt(description)
+
         try:
-            output = self.model(
-                prompt,
-                max_tokens=100,
-                temperature=0.3,
-                top_p=0.9,
-                stop=["Enhanced technical description:"]
-            )
+            # Greedy decode: llama.cpp fast-paths top_k=1 to an argmax, and the
+            # newline stop halts as soon as the single enhanced sentence is out
+            with self.model_manager.inference_lock:
+                output = self.model(
+                    prompt,
+                    max_tokens=80,
+                    temperature=0.0,
+                    top_k=1,
+                    stop=["\n", "Original description:", "Enhanced technical description:"]
+                )
             generated_text = output['choices'][0]['text'].strip()
             if "Enhanced technical description:" in generated_text:
                 enhanced = generated_text.split("Enhanced technical description:", 1)[-1].strip()
@@ -141,29 +246,29 @@ class TechnicalMessageGenerator:
     def generate_intervention_phrase(self, action: str) -> str:
         translated_action = self.translate_action(action)
         action_verb = self._action_to_verb(translated_action)
-        
+
+        # The prompt asks the model for exactly the template below and
+        # _clean_and_validate_report rejects anything else, so the LLM call is
+        # pure overhead here. Keep it behind a flag for A/B comparison only.
+        if os.getenv('USE_LLM_INTERVENTION') != '1':
+            return f"The affected component was {action_verb}."
+
         prompt = (
-            f"Generate a concise, professional technical intervention report for an ATM repair.\n"
-            f"Action taken: {action_verb}\n"
-            f"Rules:\n"
-            f"1. Use formal language\n"
-            f"2. Be concise (one sentence)\n"
-            f"3. Focus ONLY on the solution\n"
-            f"4. NEVER mention specific components - use ONLY 'the affected component'\n"
-            f"5. Avoid mentioning the issue or problem\n"
-            f"6. Do NOT use technical component names\n"
-            f"7. Example format: 'The affected component was {action_verb}.'\n"
-            f"Intervention report:"
+            _INTERVENTION_PREFIX
+            + f"Action taken: {action_verb}\n"
+            + "Intervention report:"
         )
-        
+
         try:
-            output = self.model(
-                prompt,
-                max_tokens=40,
-                temperature=0.1,
-                top_p=0.9,
-                stop=["Intervention report:"]
-            )
+            # The target sentence is ~8 tokens; stop at the period instead of the cap
+            with self.model_manager.inference_lock:
+                output = self.model(
+                    prompt,
+                    max_tokens=24,
+                    temperature=0.0,
+                    top_k=1,
+                    stop=[".", "\n", "Intervention report:"]
+                )
             generated_text = output['choices'][0]['text'].strip()
             report = generated_text.split("Intervention report:", 1)[-1].strip() if "Intervention report:" in generated_text else generated_text
             return self._clean_and_validate_report(report, action_verb)
@@ -203,8 +308,10 @@ class TechnicalMessageGenerator:
             return "unknown issue"
 
         ticket_type_str = ""
-        for i in range(len(issue_tokens)):
-            candidate = "_".join(issue_tokens[:i+1])
+        for length in self._ticket_token_lens:
+            if length > len(issue_tokens):
+                continue
+            candidate = "_".join(issue_tokens[:length])
             if candidate in self.ticket_types:
                 ticket_type_str = candidate
                 break
@@ -249,8 +356,12 @@ class TechnicalMessageGenerator:
 
         is_closing_ticket = any(action for (_, action) in problem_actions)
 
+        problem_descriptions = [desc for (desc, _) in problem_actions]
+        if os.getenv('ENABLE_ENHANCEMENT') == '1':
+            # Optional LLM rephrasing, batched over all problems with a shared prefix
+            problem_descriptions = self.enhance_many(problem_descriptions)
+
         if is_closing_ticket:
-            problem_descriptions = [desc for (desc, _) in problem_actions]
             actions = [action for (_, action) in problem_actions]
             intervention_phrases = [
                 self.generate_intervention_phrase(action)
@@ -277,8 +388,6 @@ class TechnicalMessageGenerator:
                     f"{interventions_list}"
                 )
         else:
-            problem_descriptions = [desc for (desc, _) in problem_actions]
-
             if len(problem_descriptions) == 1:
                 message = (
                     f"Dear Customer,\n"
@@ -299,7 +408,39 @@ class TechnicalMessageGenerator:
 
 # --- Flask App ---
 app = Flask(__name__)
-generator = TechnicalMessageGenerator()
+
+# Lazy singleton: importing the module (e.g. for bootstrap_classifications or
+# gunicorn --preload fork setup) no longer pays the multi-GB model load; the
+# first request or an explicit /warmup does
+_generator = None
+_generator_lock = Lock()
+
+def get_generator():
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                _generator = TechnicalMessageGenerator()
+    return _generator
+
+@app.route('/warmup', methods=['POST'])
+def warmup():
+    # Load the model and run a one-token generation so the first real request
+    # doesn't pay the load + first-eval cost
+    try:
+        gen = get_generator()
+        with gen.model_manager.inference_lock:
+            gen.model("hi", max_tokens=1)
+        return jsonify({"status": "warm"}), 200
+    except Exception as e:
+        logger.error(f" Error in /warmup: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# Response-level LRU: generation is deterministic (greedy decoding), so repeat
+# inputs — the same error codes recur daily — skip Llama entirely
+_response_cache = collections.OrderedDict()
+_response_cache_lock = Lock()
+_RESPONSE_CACHE_MAX = 2048
 
 @app.route('/generate-message', methods=['POST'])
 def generate_message():
@@ -309,18 +450,42 @@ def generate_message():
     if not technical_input:
         return jsonify({"error": "Missing technical_input"}), 400
 
+    cache_key = technical_input.strip()
+    use_cache = request.args.get('no_cache') != '1'
+    if use_cache:
+        with _response_cache_lock:
+            cached = _response_cache.get(cache_key)
+            if cached is not None:
+                _response_cache.move_to_end(cache_key)
+                return jsonify(cached), 200
+
     try:
-        result = generator.generate_client_message(technical_input)
+        result = get_generator().generate_client_message(technical_input)
         logger.info(f"Generated result: {result}")
+        if use_cache:
+            with _response_cache_lock:
+                _response_cache[cache_key] = result
+                _response_cache.move_to_end(cache_key)
+                if len(_response_cache) > _RESPONSE_CACHE_MAX:
+                    _response_cache.popitem(last=False)
         return jsonify(result), 200
     except Exception as e:
         logger.error(f" Error in /generate-message: {e}")
         return jsonify({"error": str(e)}), 500
 
-if __name__ == '__main__':
+def bootstrap_classifications():
+    # Run separately before starting gunicorn workers (python -c "from
+    # message_generator_server import bootstrap_classifications; bootstrap_classifications()")
+    # so each worker doesn't redo the classification pass
     classifier = TermClassifier("Abreviation_et_Description_V1.xlsx")
     if classifier.run():
         logger.info(" Classification terminée avec succès")
     else:
         logger.error(" Erreur pendant la classification")
-    app.run(port=5000, threaded=True)
+
+
+if __name__ == '__main__':
+    # Development entrypoint; in production run via gunicorn (see install.md):
+    #   gunicorn -w 1 --threads 4 -b 0.0.0.0:5000 message_generator_server:app
+    bootstrap_classifications()
+    app.run(port=5000, threaded=True, debug=False)
@@ -0,0 +1,77 @@
+"""Shared, cached access to the three term classification JSON files.
+
+Both servers parse actions.json / components.json / ticket_types.json at
+startup and re-derive lowercased lookup maps from them. The files never change
+at runtime, so everything is parsed and derived exactly once per process here.
+"""
+import json
+import re
+from functools import lru_cache
+
+try:
+    import ahocorasick  # single linear scan over the text instead of a giant regex alternation
+except ImportError:
+    ahocorasick = None
+
+JSON_FILES = {
+    'actions': 'actions.json',
+    'components': 'components.json',
+    'ticket_types': 'ticket_types.json'
+}
+
+_RE_FR_TAIL = re.compile(r'[@#*]+$')
+
+# Translation pairs that are not in the JSON stores but belong in the same
+# single-pass term scan (longest JSON terms such as 'atm application' still win)
+EXTRA_TERMS = {'atm': 'DAB'}
+
+
+@lru_cache(maxsize=1)
+def load_terms():
+    """Parse the JSON files and precompute every derived lookup structure.
+
+    Returns a dict with the raw per-category dicts plus:
+    - 'en_fr_maps': per-category {lowercased EN term: cleaned FR term}
+    - 'all_terms': the three maps merged
+    - 'sorted_terms': EN terms sorted longest-first (for regex alternations)
+    - 'aho': a pyahocorasick automaton over all EN terms, or None
+    """
+    data = {}
+    for name, path in JSON_FILES.items():
+        with open(path, encoding='utf-8') as f:
+            data[name] = json.load(f)
+
+    en_fr_maps = {'actions': {}, 'components': {}, 'ticket_types': {}}
+    for name, entries in data.items():
+        for key, entry in entries.items():
+            if not isinstance(entry, dict) or 'en' not in entry or 'fr' not in entry:
+                continue
+            en_term = entry['en'].strip().lower()
+            fr_term = _RE_FR_TAIL.sub('', entry['fr'].strip()).strip()
+            if en_term and fr_term:
+                en_fr_maps[name][en_term] = fr_term
+
+    all_terms = {
+        **en_fr_maps['actions'],
+        **en_fr_maps['components'],
+        **en_fr_maps['ticket_types'],
+        **EXTRA_TERMS
+    }
+    sorted_terms = tuple(sorted(all_terms, key=len, reverse=True))
+
+    automaton = None
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for en_term, fr_term in all_terms.items():
+            automaton.add_word(en_term, (len(en_term), fr_term))
+        automaton.make_automaton()
+
+    return {
+        'actions': data['actions'],
+        'components': data['components'],
+        'ticket_types': data['ticket_types'],
+        'en_fr_maps': en_fr_maps,
+        'all_terms': all_terms,
+        'sorted_terms': sorted_terms,
+        'aho': automaton
+    }
@@ -1,11 +1,25 @@
-import json
+import collections
+import os
 import re
 import logging
+import threading
 from flask import Flask, request, jsonify
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
 import torch
 from datetime import datetime
 
+from term_store import load_terms
+
+try:
+    import ctranslate2  # C++ batched decoding, no Python pipeline overhead
+except ImportError:
+    ctranslate2 = None
+
+# Converted offline with:
+#   ct2-transformers-converter --model facebook/nllb-200-distilled-600M \
+#       --output_dir nllb-ct2 --quantization float16
+CT2_MODEL_DIR = 'nllb-ct2'
+
 # --- Logging setup ---
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -26,77 +40,185 @@ logger.addHandler(console_handler)
 
 app = Flask(__name__)
 
+# Patterns compiled once at import instead of on every request
+_RE_ATM = re.compile(r'\bATM\b', re.IGNORECASE)
+_RE_PLACEHOLDER_TAIL = re.compile(r'[@#*]+$')
+_RE_PLACEHOLDER_ANY = re.compile(r'[@#*]+')
+_RE_DOT_NO_SPACE = re.compile(r'\.(?=\S)')
+_RE_DOTS = re.compile(r'\.+')
+_RE_PUNCT_RUN = re.compile(r'[.,;!?]+(?=[.,;!?])')
+_RE_LE_APP = re.compile(r'\b(?:le|la)\s+Application\s+DAB\b', re.IGNORECASE)
+_RE_DAB_APP = re.compile(r'\bDAB\s+de\s+l\'application\b', re.IGNORECASE)
+_RE_L_EQUIPE = re.compile(r"\bL'équipe\b", re.IGNORECASE)
+_RE_TERM_PLACEHOLDER = re.compile(r'@@TERM\d+@@')
+
 class FrenchTranslator:
     def __init__(self):
         logger.info("Initializing FrenchTranslator")
         try:
             model_name = "facebook/nllb-200-distilled-600M"
             self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-            self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
-            self.translator = pipeline(
-                "translation",
-                model=self.model,
-                tokenizer=self.tokenizer,
-                src_lang="eng_Latn",
-                tgt_lang="fra_Latn",
-                device=0 if torch.cuda.is_available() else -1
-            )
+            self.tokenizer.src_lang = "eng_Latn"
+            use_cuda = torch.cuda.is_available()
+
+            # CTranslate2 backend when the converted model is available: batched
+            # decoding runs entirely in C++, so the HF model isn't loaded at all
+            self._ct2 = None
+            if ctranslate2 is not None and os.path.isdir(CT2_MODEL_DIR):
+                try:
+                    self._ct2 = ctranslate2.Translator(
+                        CT2_MODEL_DIR,
+                        device='cuda' if use_cuda else 'cpu',
+                        compute_type='float16' if use_cuda else 'default'
+                    )
+                    logger.info(" CTranslate2 NLLB backend loaded.")
+                except Exception as e:
+                    logger.warning(f" CTranslate2 backend unavailable, using transformers: {e}")
+                    self._ct2 = None
+            if self._ct2 is not None:
+                self.model = None
+                self.translator = None
+                # Warm up the C++ runtime once
+                try:
+                    self._generate_batch_ct2(['hello'])
+                except Exception as e:
+                    logger.warning(f" Warmup translate failed: {e}")
+            else:
+                # fp16 on GPU: halves the weight traffic of every decode step; decoding
+                # this 600M model is memory-bandwidth-bound, not compute-bound
+                self.model = AutoModelForSeq2SeqLM.from_pretrained(
+                    model_name,
+                    torch_dtype=torch.float16 if use_cuda else torch.float32
+                )
+                if use_cuda:
+                    self.model = self.model.to('cuda')
+                # Fused scaled-dot-product attention: same FLOPs, far fewer memory
+                # round-trips. Prefer BetterTransformer when optimum is installed,
+                # else try torch.compile; both silently fall back to eager.
+                try:
+                    from optimum.bettertransformer import BetterTransformer
+                    self.model = BetterTransformer.transform(self.model)
+                    logger.info(" BetterTransformer enabled.")
+                except Exception:
+                    try:
+                        self.model = torch.compile(self.model, mode='reduce-overhead', fullgraph=False)
+                        logger.info(" torch.compile enabled.")
+                    except Exception as e:
+                        logger.info(f" Keeping eager attention: {e}")
+                self.translator = pipeline(
+                    "translation",
+                    model=self.model,
+                    tokenizer=self.tokenizer,
+                    src_lang="eng_Latn",
+                    tgt_lang="fra_Latn",
+                    device=0 if torch.cuda.is_available() else -1
+                )
+                # Warm up once so the first real request doesn't pay the compile cost
+                try:
+                    warmup = self.tokenizer('hello', return_tensors='pt').to(self.model.device)
+                    self.model.generate(**warmup, max_length=16)
+                except Exception as e:
+                    logger.warning(f" Warmup generate failed: {e}")
             logger.info(" NLLB-200 model loaded successfully.")
         except Exception as e:
             logger.error(f" Failed to load NLLB-200 model: {e}")
             raise
 
-        self.json_files = {
-            'actions': 'actions.json',
-            'components': 'components.json',
-            'ticket_types': 'ticket_types.json'
-        }
-
         self._load_json_files()
         self._build_term_maps()
 
+        # LRU cache of per-line translations (normalized line -> translated line),
+        # lock-guarded: the server runs threaded (gunicorn --threads)
+        self._line_cache = collections.OrderedDict()
+        self._cache_max = 4096
+        self._cache_lock = threading.Lock()
+
     def _load_json_files(self):
+        # Parsed once per process by term_store and shared with the generator server
         try:
-            with open(self.json_files['actions'], encoding='utf-8') as f:
-                self.actions = json.load(f)
-            with open(self.json_files['components'], encoding='utf-8') as f:
-                self.components = json.load(f)
-            with open(self.json_files['ticket_types'], encoding='utf-8') as f:
-                self.ticket_types = json.load(f)
+            store = load_terms()
+            self.actions = store['actions']
+            self.components = store['components']
+            self.ticket_types = store['ticket_types']
             logger.info(" JSON files loaded successfully.")
         except Exception as e:
             logger.error(f" JSON loading error: {e}")
             raise
 
     def _build_term_maps(self):
-        self.term_maps = {'actions': {}, 'components': {}, 'types': {}}
-        for dico, data in [('actions', self.actions), ('components', self.components), ('types', self.ticket_types)]:
-            for key, entry in data.items():
-                if not isinstance(entry, dict) or 'en' not in entry or 'fr' not in entry:
-                    continue
-                en_term = entry['en'].strip().lower()
-                fr_term = re.sub(r'[@#*]+$', '', entry['fr'].strip())
-                if en_term and fr_term:
-                    self.term_maps[dico][en_term] = fr_term
+        store = load_terms()
+        self.term_maps = {
+            'actions': store['en_fr_maps']['actions'],
+            'components': store['en_fr_maps']['components'],
+            'types': store['en_fr_maps']['ticket_types']
+        }
+        # Aho-Corasick automaton over all EN terms: matches every term in one pass,
+        # built once by term_store instead of compiling an alternation per request
+        self._aho = store['aho']
+        # Fallback path without pyahocorasick: merged map and longest-first
+        # alternation compiled once here, not per request
+        self._all_terms = store['all_terms']
+        self._term_pattern = re.compile(
+            r'\b(' + '|'.join(map(re.escape, store['sorted_terms'])) + r')\b',
+            flags=re.IGNORECASE
+        )
         logger.info(" Term maps built.")
 
     def _replace_technical_terms_with_placeholders(self, text: str):
-        all_terms = {
-            **self.term_maps['actions'],
-            **self.term_maps['components'],
-            **self.term_maps['types']
-        }
+        if self._aho is not None:
+            # The automaton carries the ATM->DAB rewrite too, so the text is
+            # scanned exactly once instead of an extra whole-text regex pass
+            return self._replace_terms_aho(text)
+        text = _RE_ATM.sub('DAB', text)
+        return self._replace_terms_regex(text)
+
+    @staticmethod
+    def _is_word_boundary(text, start, end):
+        if start > 0 and (text[start - 1].isalnum() or text[start - 1] == '_'):
+            return False
+        if end < len(text) and (text[end].isalnum() or text[end] == '_'):
+            return False
+        return True
+
+    def _replace_terms_aho(self, text: str):
+        # One linear automaton scan; overlapping hits resolved longest-match-first
+        text_lc = text.lower()
+        hits = []
+        for end, (length, fr_term) in self._aho.iter(text_lc):
+            start = end - length + 1
+            if self._is_word_boundary(text_lc, start, end + 1):
+                hits.append((start, end + 1, fr_term))
+        hits.sort(key=lambda h: (h[0], h[0] - h[1]))
+
+        placeholder_map = {}
+        pieces = []
+        pos = 0
+        counter = 0
+        for start, end, fr_term in hits:
+            if start < pos:
+                continue  # overlapped by an earlier (longer) match
+            placeholder = f"@@TERM{counter}@@"
+            placeholder_map[placeholder] = fr_term
+            counter += 1
+            pieces.append(text[pos:start])
+            pieces.append(placeholder)
+            pos = end
+        pieces.append(text[pos:])
+        replaced_text = ''.join(pieces)
+        logger.debug(f"Text with placeholders: {replaced_text}")
+        logger.debug(f"Placeholder map: {placeholder_map}")
 
-        text = re.sub(r'\bATM\b', 'DAB', text, flags=re.IGNORECASE)
-        sorted_terms = sorted(all_terms.keys(), key=lambda x: -len(x))
+        return replaced_text, placeholder_map
 
+    def _replace_terms_regex(self, text: str):
+        # Fallback when pyahocorasick is not installed; map and pattern are
+        # prebuilt in _build_term_maps
         placeholder_map = {}
         placeholder_counter = 0
 
         def replacer(match):
             nonlocal placeholder_counter
-            term = match.group(0).lower()
-            fr_term = all_terms.get(term)
+            fr_term = self._all_terms.get(match.group(0).lower())
             if not fr_term:
                 return match.group(0)
             placeholder = f"@@TERM{placeholder_counter}@@"
@@ -104,13 +226,100 @@ class FrenchTranslator:
             placeholder_counter += 1
             return placeholder
 
-        pattern = re.compile(r'\b(' + '|'.join(map(re.escape, sorted_terms)) + r')\b', flags=re.IGNORECASE)
-        replaced_text = pattern.sub(replacer, text)
+        replaced_text = self._term_pattern.sub(replacer, text)
         logger.debug(f"Text with placeholders: {replaced_text}")
         logger.debug(f"Placeholder map: {placeholder_map}")
 
         return replaced_text, placeholder_map
 
+    @staticmethod
+    def _normalize_placeholders(line):
+        # Renumber @@TERMn@@ placeholders positionally (@@T0@@, @@T1@@, ...) so two
+        # lines that only differ by placeholder numbering share one cache entry
+        placeholders = list(dict.fromkeys(_RE_TERM_PLACEHOLDER.findall(line)))
+        normalized = line
+        for i, placeholder in enumerate(placeholders):
+            normalized = normalized.replace(placeholder, f'@@T{i}@@')
+        return normalized, placeholders
+
+    def _translate_batch(self, texts):
+        # Boilerplate lines ("Dear Customer," etc.) recur on every report: serve them
+        # from an exact-match LRU keyed on the placeholder-normalized line and only
+        # send the misses to the model
+        results = [None] * len(texts)
+        miss_texts, miss_slots = [], []
+        for i, text in enumerate(texts):
+            normalized, placeholders = self._normalize_placeholders(text)
+            with self._cache_lock:
+                cached = self._line_cache.get(normalized)
+                if cached is not None:
+                    self._line_cache.move_to_end(normalized)
+            if cached is not None:
+                restored = cached
+                for j, placeholder in enumerate(placeholders):
+                    restored = restored.replace(f'@@T{j}@@', placeholder)
+                results[i] = restored
+            else:
+                miss_texts.append(text)
+                miss_slots.append((i, normalized, placeholders))
+
+        if miss_texts:
+            translations = self._generate_batch(miss_texts)
+            for (i, normalized, placeholders), translation in zip(miss_slots, translations):
+                results[i] = translation
+                cacheable = translation
+                for j, placeholder in enumerate(placeholders):
+                    cacheable = cacheable.replace(placeholder, f'@@T{j}@@')
+                with self._cache_lock:
+                    self._line_cache[normalized] = cacheable
+                    self._line_cache.move_to_end(normalized)
+                    if len(self._line_cache) > self._cache_max:
+                        self._line_cache.popitem(last=False)
+        return results
+
+    def _generate_batch_ct2(self, texts):
+        # translate_batch takes pre-tokenized source tokens and decodes greedily
+        # in C++; the returned hypotheses start with the forced 'fra_Latn' prefix
+        src_tokens = [
+            self.tokenizer.convert_ids_to_tokens(self.tokenizer(text).input_ids)
+            for text in texts
+        ]
+        results = self._ct2.translate_batch(
+            src_tokens,
+            target_prefix=[['fra_Latn']] * len(texts),
+            beam_size=1
+        )
+        return [
+            self.tokenizer.decode(
+                self.tokenizer.convert_tokens_to_ids(result.hypotheses[0][1:]),
+                skip_special_tokens=True
+            )
+            for result in results
+        ]
+
+    def _generate_batch(self, texts):
+        if self._ct2 is not None:
+            return self._generate_batch_ct2(texts)
+        # One padded generate over the whole batch: the encoder and decoder work
+        # across the batch dimension instead of one sequential call per line
+        if len(texts) == 1:
+            # Single line: the pipeline path is just as fast and simpler
+            return [self.translator(texts[0], max_length=512)[0]['translation_text']]
+        tok = self.tokenizer(
+            texts, return_tensors='pt', padding=True, truncation=True, max_length=512
+        ).to(self.model.device)
+        # Budget the decoder from the actual input length instead of a flat 512:
+        # EN->FR grows ~1.2x in tokens, so 1.5x plus a small slack is ample and
+        # a runaway generation stops hundreds of tokens sooner
+        longest_input = int(tok['attention_mask'].sum(dim=1).max().item())
+        out = self.model.generate(
+            **tok,
+            forced_bos_token_id=self.tokenizer.convert_tokens_to_ids('fra_Latn'),
+            max_new_tokens=min(int(longest_input * 1.5) + 8, 128),
+            num_beams=1
+        )
+        return self.tokenizer.batch_decode(out, skip_special_tokens=True)
+
     def translate_text(self, text: str) -> str:
         text = text.strip()
         if not text:
@@ -143,35 +352,47 @@ class FrenchTranslator:
                     default_intervention = "\nLe composant affecté a été remplacé"  # Non-enumerated for single problem
                 lines.append(default_intervention)
 
-            # Translate each line
-            for line in lines:
-                if line.strip():
-                    match = re.match(r'^(\d+\.\s+)', line)
-                    if match:
-                        number_part = match.group(0)
-                        text_part = line[len(number_part):].strip()
-                        translated_text_part = self.translator(text_part, max_length=512)[0]['translation_text']
-                        translated_lines.append(number_part + translated_text_part)
-                    else:
-                        translated_lines.append(self.translator(line.strip(), max_length=512)[0]['translation_text'])
-                else:
-                    translated_lines.append("")  # Preserve empty lines
+            # Collect all translatable lines, then translate them in one batched call
+            translated_lines = [""] * len(lines)  # Preserve empty lines
+            payloads = []
+            slots = []  # (line index, enumeration prefix)
+            for i, line in enumerate(lines):
+                if not line.strip():
+                    continue
+                # Cheap string ops instead of a regex match per line: an
+                # enumeration prefix is "<digits>. " at the start of the line
+                number_part = ""
+                if line[:1].isdigit():
+                    head, sep, tail = line.partition('. ')
+                    if sep and head.isdigit():
+                        number_part = head + sep
+                        line = tail
+                payloads.append(line.strip())
+                slots.append((i, number_part))
+
+            if payloads:
+                translations = self._translate_batch(payloads)
+                for (i, number_part), translation in zip(slots, translations):
+                    translated_lines[i] = number_part + translation
             result = '\n'.join(translated_lines)
 
             logger.info(f"Raw translation: {result}")
 
-            for placeholder, fr_term in placeholder_map.items():
-                clean_fr_term = re.sub(r'[@#*]+$', '', fr_term).strip()
-                result = result.replace(placeholder, clean_fr_term)
+            # Single pass over the text: term_store already stripped the FR terms,
+            # so restoring is a pure dict lookup instead of one full-text
+            # str.replace (plus a cleanup sub) per placeholder
+            result = _RE_TERM_PLACEHOLDER.sub(
+                lambda m: placeholder_map.get(m.group(0), m.group(0)), result
+            )
 
-            result = re.sub(r'[@#*]+', '', result)
-            result = re.sub(r'\.(?=\S)', ' ', result)
-            result = re.sub(r'\.+', '.', result)
-            result = re.sub(r'[.,;!?]+(?=[.,;!?])', '', result)
+            result = _RE_PLACEHOLDER_ANY.sub('', result)
+            result = _RE_DOT_NO_SPACE.sub(' ', result)
+            result = _RE_DOTS.sub('.', result)
+            result = _RE_PUNCT_RUN.sub('', result)
 
-            result = re.sub(r'\b(?:le|la|Le|La)\s+Application\s+DAB\b', r"l'Application DAB", result, flags=re.IGNORECASE)
-            result = re.sub(r'\bDAB\s+de\s+l\'application\b', r"Application DAB", result, flags=re.IGNORECASE)
-            result = re.sub(r'\bL\'équipe\b', r"l'équipe", result, flags=re.IGNORECASE)
+            result = _RE_LE_APP.sub("l'Application DAB", result)
+            result = _RE_DAB_APP.sub("Application DAB", result)
+            result = _RE_L_EQUIPE.sub("l'équipe", result)
 
             if not result.endswith(('.', '!', '?')):
                 result += '.'
@@ -189,6 +410,12 @@ try:
 except Exception as e:
     logger.error(f"Translator initialization error: {e}")
 
+# Response-level LRU on top of the per-line cache: greedy decoding makes the
+# endpoint a pure function of its input, so repeat texts skip the model
+_response_cache = collections.OrderedDict()
+_response_cache_lock = threading.Lock()
+_RESPONSE_CACHE_MAX = 4096
+
 @app.route('/translate', methods=['POST'])
 def translate():
     if translator is None:
@@ -199,12 +426,30 @@ def translate():
         return jsonify({"error": "Missing 'text' field"}), 400
 
     text = data['text']
+    cache_key = text.strip()
+    use_cache = request.args.get('no_cache') != '1'
+    if use_cache:
+        with _response_cache_lock:
+            cached = _response_cache.get(cache_key)
+            if cached is not None:
+                _response_cache.move_to_end(cache_key)
+                return jsonify({"translated_text": cached}), 200
+
     try:
         translated_text = translator.translate_text(text)
+        if use_cache:
+            with _response_cache_lock:
+                _response_cache[cache_key] = translated_text
+                _response_cache.move_to_end(cache_key)
+                if len(_response_cache) > _RESPONSE_CACHE_MAX:
+                    _response_cache.popitem(last=False)
         return jsonify({"translated_text": translated_text}), 200
     except Exception as e:
         logger.error(f" Translation error: {e}")
         return jsonify({"error": "Translation failed"}), 500
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5002, debug=True)
\ No newline at end of file
+    # Development entrypoint; in production run via gunicorn (see install.md):
+    #   gunicorn -w 2 --threads 2 -b 0.0.0.0:5002 translation_server:app
+    # debug=True disabled the Werkzeug optimizations and reloaded on file changes
+    app.run(host='0.0.0.0', port=5002, debug=False)
\ No newline at end of file